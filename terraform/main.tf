@@ -81,7 +81,8 @@ resource "aws_security_group" "default" {
   }
 }
 
-# AMI to use for our instances
+# AMI to use for our instances. Its python3 (3.6 on Bionic) must meet the
+# utilities' minimum Python version, see the README.
 data "aws_ami" "ubuntu" {
   most_recent = true
 
@@ -1,25 +1,31 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 """
 Deals with S3 interactions, including pulling the server, pushing backups,
 tagging old backups to expire, and more.
 """
 
+import hashlib
 import logging
 import os
 import re
 import shutil
 import sys
 from argparse import ArgumentParser
-from ConfigParser import ConfigParser
+from configparser import ConfigParser
 from datetime import datetime, timedelta
-from tempfile import mkdtemp
-from zipfile import ZipFile, BadZipfile
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile, mkdtemp
+from urllib.parse import urlencode
+from zipfile import ZipFile, BadZipFile, ZIP_DEFLATED, ZIP_STORED
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 
 # Logging
-LOG_FORMAT = u'%(asctime)s [%(levelname)s] %(message)s'
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
 logger = logging.getLogger('prospector')
 logger.setLevel(logging.INFO)
 logger.handlers = []
@@ -28,10 +34,77 @@ formatter = logging.Formatter(LOG_FORMAT)
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-# a list of regexes matching file names, and the date format string that can
-# be matched against the first regex group.
-S3_BACKUP_RE = re.compile('\w+-(\d{8}T\d{6}).zip')
+# date format string used to stamp backup keys, which sorts lexicographically,
+# and a regex matching that stamp at the end of a backup key or filename
 S3_BACKUP_DATE_FMT = '%Y%m%dT%H%M%S'
+S3_BACKUP_STAMP_RE = re.compile(r'-(\d{8}T\d{6})(?:\.zip)?$')
+
+# Oldest cutoff, in days, probed for recent backups before falling back to a
+# full listing of the backup prefix
+S3_PROBE_MAX_DAYS = 64
+
+# Size of the buffer used when streaming archive members to disk
+EXTRACT_BUFFER_SIZE = 1024 * 1024
+
+# Region files, and the external chunk files that go with them, hold chunks
+# that are already compressed, so re-deflating them burns CPU for no real gain
+# in size. Everything else is deflated at a low, fast level.
+PRECOMPRESSED_EXTENSIONS = ('.mca', '.mcr', '.mcc')
+BACKUP_COMPRESSLEVEL = 1
+
+# ZipFile only takes a compression level on Python 3.7 and newer, older
+# interpreters fall back to zlib's default level
+if sys.version_info >= (3, 7):
+    BACKUP_ZIP_ARGS = {'compresslevel': BACKUP_COMPRESSLEVEL}
+else:
+    BACKUP_ZIP_ARGS = {}
+
+# Archives up to this size are built in memory when pushing a backup, larger
+# ones spill over to a temporary file
+BACKUP_SPOOL_SIZE = 64 * 1024 * 1024
+
+# Size of the chunks read when hashing backup archives
+HASH_BUFFER_SIZE = 1024 * 1024
+
+# Backups are routinely hundreds of megabytes, so transfer them in parallel
+# multipart chunks, with enough pooled connections to keep every thread busy.
+# Uploads from a file object read each part into memory first, so those are
+# capped at 4 buffered parts, i.e. 64 MiB on top of the backup spool, to leave
+# the rest of the box to the server.
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=16,
+    use_threads=True
+)
+# boto3's TransferConfig doesn't take this as an argument, but passes the
+# attribute through to s3transfer
+S3_TRANSFER_CONFIG.max_in_memory_upload_chunks = 4
+S3_CLIENT_CONFIG = Config(
+    max_pool_connections=32,
+    retries={'max_attempts': 5, 'mode': 'adaptive'}
+)
+
+# S3 client shared by every Prospector, see `get_s3_client`
+_s3_client = None
+
+# Settings read from the 'main' section of the config file, passed through to
+# the Prospector
+CONFIG_KEYS = ('s3_bucket', 'server_name', 'server_root_dir', 'world_name')
+
+# Sentinel for values that haven't been looked up yet, as `None` is meaningful
+_MISSING = object()
+
+
+def get_s3_client():
+    """
+    Returns the S3 client shared by all Prospectors, creating it on first use
+    so credentials are resolved and connections pooled only once per process.
+    """
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.session.Session().client('s3', config=S3_CLIENT_CONFIG)
+    return _s3_client
 
 
 class Prospector(object):
@@ -44,39 +117,64 @@ class Prospector(object):
         self.world_name = world_name
         self.server_root_dir = server_root_dir
 
-        self.s3_bucket = s3_bucket
-        self.client = boto3.client('s3')
+        # Derived from the settings above, which are fixed for the lifetime of
+        # the instance, so they're only built once
+        self.s3_backup_prefix = '{}/backups/{}'.format(server_name, world_name)
+        self.server_path = os.path.join(server_root_dir, server_name)
+        self.world_path = os.path.join(self.server_path, world_name)
 
-    @property
-    def s3_backup_prefix(self):
-        return '{}/backups/{}'.format(self.server_name, self.world_name)
+        self.s3_bucket = s3_bucket
 
-    @property
-    def server_path(self):
-        return os.path.join(self.server_root_dir, self.server_name)
+        # Most recent backup key in S3, looked up on first use
+        self._latest_backup_key = _MISSING
 
     @property
-    def world_path(self):
-        return os.path.join(self.server_root_dir, self.server_name, self.world_name)
+    def client(self):
+        """
+        The S3 client, shared with every other Prospector in this process.
+        """
+        return get_s3_client()
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def backup_time_from_key(backup_key):
         """
         Given a backup filename or S3 key, returns a `datetime` instance for
         that key's time.
         """
-        fname = os.path.basename(backup_key)
-        if fname.endswith('.zip'):
-            fname = fname[:-4]
-        date = fname.split('-')[1]
-        return datetime.strptime(date, S3_BACKUP_DATE_FMT)
+        result = S3_BACKUP_STAMP_RE.search(backup_key)
+        if not result:
+            raise ValueError("'{}' is not a backup key".format(backup_key))
+        return datetime.strptime(result.group(1), S3_BACKUP_DATE_FMT)
+
+    @staticmethod
+    def iter_files(path, base):
+        """
+        Yields `(file_path, relative_path)` pairs for every file beneath
+        `path`, where `relative_path` is relative to `base`, which must be
+        `path` or one of its parents. Symlinks to files are treated as the
+        files they point to, while symlinked directories, broken symlinks and
+        anything else that isn't a regular file are skipped.
+        """
+        # Paths are built by concatenation from here on, so the prefix to
+        # strip only needs to be computed once
+        base_len = len(base.rstrip(os.sep) + os.sep)
+
+        stack = [path]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.path, entry.path[base_len:]
 
     def tag_s3_object(self, key, **kwargs):
         """
         Tag an s3 object identified by `key` with the key-value pairs in
         `kwargs`.
         """
-        tags = [{ 'Key': k, 'Value': v } for k, v in kwargs.iteritems()]
+        tags = [{ 'Key': k, 'Value': v } for k, v in kwargs.items()]
         self.client.put_object_tagging(
             Bucket=self.s3_bucket,
             Key=key,
@@ -107,15 +205,15 @@ class Prospector(object):
                 tmp_path
             ))
 
-            self.client.download_file(self.s3_bucket, key, tmp_path)
+            self.client.download_file(self.s3_bucket, key, tmp_path,
+                                      Config=S3_TRANSFER_CONFIG)
 
             try:
                 with ZipFile(tmp_path, 'r') as z:
                     # This makes the assumption that the archive contains the world
                     # as a subfolder, so it extracts correctly.
-                    z.extractall(os.path.join(self.server_root_dir,
-                                              self.server_name))
-            except BadZipfile:
+                    self.extract_backup(z, self.server_path)
+            except BadZipFile:
                 logger.error("Zipfile is bad!")
 
             # Cleanup
@@ -123,33 +221,120 @@ class Prospector(object):
         else:
             logger.warning("No backups found in S3")
 
-    def upload_backup(self, zipfile):
+    @staticmethod
+    def extract_backup(z, dest):
         """
-        Uploads `zipfile` to S3, stamping it using the current time. The
-        previous most-recent backup in S3, if one exists, is re-tagged as old.
+        Extracts the files in the open `ZipFile` `z` to the `dest` directory,
+        streaming each member straight to disk. Directory entries, macOS
+        metadata and any members that would land outside of `dest` are
+        skipped.
+        """
+        dest = os.path.abspath(dest)
+        for info in z.infolist():
+            if info.filename.endswith('/') or '__MACOSX' in info.filename:
+                continue
+
+            target = os.path.abspath(os.path.join(dest, info.filename))
+            if not target.startswith(dest + os.sep):
+                logger.warning("Skipping archive member '{}' outside of {}".format(info.filename, dest))
+                continue
+
+            target_dir = os.path.dirname(target)
+            if not os.path.isdir(target_dir):
+                os.makedirs(target_dir)
+
+            # Write to a partial file first, so an interrupted extraction
+            # never leaves a truncated file in place. The partial file is
+            # removed if anything goes wrong, so it can't end up in a backup.
+            part_path = target + '.part'
+            try:
+                with z.open(info) as src, open(part_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, EXTRACT_BUFFER_SIZE)
+            except BaseException:
+                os.remove(part_path)
+                raise
+            os.rename(part_path, target)
+
+    @staticmethod
+    def sha256_digest(zipfile):
+        """
+        Returns the hex SHA-256 digest of `zipfile`, either a path or a
+        seekable file object. File objects are rewound to where they started.
+        """
+        h = hashlib.sha256()
+        if hasattr(zipfile, 'read'):
+            start = zipfile.tell()
+            for chunk in iter(lambda: zipfile.read(HASH_BUFFER_SIZE), b''):
+                h.update(chunk)
+            zipfile.seek(start)
+        else:
+            with open(zipfile, 'rb') as f:
+                for chunk in iter(lambda: f.read(HASH_BUFFER_SIZE), b''):
+                    h.update(chunk)
+        return h.hexdigest()
+
+    def s3_object_sha256(self, key):
+        """
+        Returns the SHA-256 digest stored in the metadata of the S3 object
+        identified by `key`, or `None` if it's missing or has none.
+        """
+        try:
+            response = self.client.head_object(Bucket=self.s3_bucket, Key=key)
+        except ClientError:
+            return None
+        return response['Metadata'].get('sha256')
+
+    def upload_backup(self, zipfile, stamp=None):
+        """
+        Uploads `zipfile`, either a path or a seekable file object, to S3,
+        stamping it with the `stamp` datetime, or the current time if not
+        given. The previous most-recent backup in S3, if one exists, is
+        re-tagged as old. If `zipfile` is identical to that backup, nothing is
+        uploaded.
         """
         latest_path = zipfile
-        latest_stamp = datetime.utcnow()
+        latest_stamp = stamp or datetime.utcnow()
 
         # Whether or not a backup has been explicitly set or we're comparing
         # periodic backups, we still do this lookup so we can retag the old
         # 'current' backup.
         latest_s3_key = self.get_most_recent_backup_key()
-        latest_s3_stamp = None
-        if latest_s3_key:
-            result = S3_BACKUP_RE.match(os.path.basename(latest_s3_key))
-            latest_s3_stamp = datetime.strptime(result.group(1),
-                                                S3_BACKUP_DATE_FMT)
+
+        # If nothing has changed since the last backup, there's no point in
+        # uploading an identical copy
+        is_fileobj = hasattr(latest_path, 'read')
+        digest = self.sha256_digest(latest_path)
+        if latest_s3_key and digest == self.s3_object_sha256(latest_s3_key):
+            logger.info("Backup is unchanged from s3://{}/{}, skipping upload".format(self.s3_bucket,
+                                                                                     latest_s3_key))
+            return
 
         new_s3_key = self.s3_backup_key(latest_stamp)
-        logger.info("Uploading backup file {} to s3://{}/{}".format(latest_path,
-                                                                    self.s3_bucket,
-                                                                    new_s3_key))
+        logger.info("Uploading backup {} to s3://{}/{}".format('archive' if is_fileobj else 'file ' + latest_path,
+                                                               self.s3_bucket,
+                                                               new_s3_key))
+
+        # The new backup is tagged as part of the upload itself, rather than
+        # with a separate request afterwards
+        upload_args = {
+            'ExtraArgs': {
+                'Tagging': urlencode({'backup': 'new'}),
+                'Metadata': {'sha256': digest}
+            },
+            'Config': S3_TRANSFER_CONFIG
+        }
+        if is_fileobj:
+            self.client.upload_fileobj(latest_path, self.s3_bucket, new_s3_key,
+                                       **upload_args)
+        else:
+            self.client.upload_file(latest_path, self.s3_bucket, new_s3_key,
+                                    **upload_args)
 
-        self.client.upload_file(latest_path, self.s3_bucket, new_s3_key)
-        self.tag_s3_object(new_s3_key, backup='new')
+        # Keep the cached lookup current without another request
+        if not latest_s3_key or new_s3_key > latest_s3_key:
+            self._latest_backup_key = new_s3_key
 
-        if latest_s3_stamp:
+        if latest_s3_key and latest_s3_key != new_s3_key:
             # If we found an older backup, retag it since it's no longer
             # current
             self.tag_s3_object(latest_s3_key, backup='old')
@@ -159,68 +344,127 @@ class Prospector(object):
         Builds a backup archive from the server's active world and pushes it to
         S3. The server must not be writing to disk while this is executing.
         """
-        backup_path = self.create_current_backup()
-        if not backup_path:
-            logger.error('Unable to create backup')
-        else:
-            self.upload_backup(backup_path)
-            shutil.rmtree(os.path.dirname(backup_path))
+        # The backup is stamped with the time it was taken, not the time the
+        # upload happens to start
+        stamp = datetime.utcnow()
+
+        # Small worlds never touch the disk, the archive is built in memory
+        # and streamed straight from there to S3
+        with SpooledTemporaryFile(max_size=BACKUP_SPOOL_SIZE) as f:
+            if not self.write_backup(f):
+                logger.error('Unable to create backup')
+            else:
+                f.seek(0)
+                self.upload_backup(f, stamp=stamp)
 
     def create_current_backup(self):
         """
-        Creates a backup archive and returns the path.
+        Creates a backup archive and returns the path, or `None` if the
+        archive couldn't be created.
 
         NOTE: Caller is responsible for removing the file and the directory
               when finished.
         """
+        backup_dir = mkdtemp()
         backup_path = os.path.join(
-            mkdtemp(),
+            backup_dir,
             os.path.basename(self.s3_backup_key(datetime.utcnow()))
         )
 
-        with ZipFile(backup_path, 'w') as z:
-           for folder, dirnames, files in os.walk(self.server_path):
-               # If we're at the top (server-level), exclude everything except
-               # the world directory
-               if folder == self.server_path:
-                   if self.world_name not in dirnames:
-                       logger.error("No world directory '{}' present in server directory {}".format(self.world_name, self.server_path))
-                       os.rmdir(os.path.dirname(backup_path))
-                       return
-                   else:
-                       # In-place removal of all directories beyond the first,
-                       # which is set to the world directory name
-                       for i in range(len(dirnames) - 1, 0, -1):
-                           dirnames.pop(i)
-                       dirnames[0] = self.world_name
-                       continue  # Don't grab any files from the base directory
-
-               archive_dir = folder.replace(self.server_path, '')
-               for file_name in files:
-                   file_path = os.path.join(folder, file_name)
-                   z.write(file_path, os.path.join(archive_dir, file_name))
-                   logger.debug('Writing {} to archive as {}'.format(file_path, os.path.join(archive_dir, file_name)))
+        with open(backup_path, 'wb') as f:
+            created = self.write_backup(f)
+
+        if not created:
+            shutil.rmtree(backup_dir)
+            return
 
         return backup_path
 
+    def write_backup(self, fileobj):
+        """
+        Writes a backup archive of the world to the seekable `fileobj`.
+        Returns whether the archive was written.
+        """
+        # Only the world directory is archived, so there's no need to look at
+        # anything else in the server directory
+        if not os.path.isdir(self.world_path):
+            logger.error("No world directory '{}' present in server directory {}".format(self.world_name, self.server_path))
+            return False
+
+        with ZipFile(fileobj, 'w', ZIP_DEFLATED, allowZip64=True,
+                     **BACKUP_ZIP_ARGS) as z:
+           for file_path, archive_path in self.iter_files(self.world_path,
+                                                          self.server_path):
+               if file_path.endswith(PRECOMPRESSED_EXTENSIONS):
+                   compress_type = ZIP_STORED
+               else:
+                   compress_type = ZIP_DEFLATED
+               z.write(file_path, archive_path, compress_type)
+               logger.debug('Writing {} to archive as {}'.format(file_path, archive_path))
+
+        return True
+
     def get_most_recent_backup_key(self):
         """
         Returns the key of the most recent backup in S3, or `None` if no
-        backups are found.
+        backups are found. The result is cached for the lifetime of this
+        instance, and kept up to date by `upload_backup`.
+        """
+        if self._latest_backup_key is _MISSING:
+            self._latest_backup_key = self.probe_most_recent_backup_key()
+        return self._latest_backup_key
+
+    def probe_most_recent_backup_key(self):
+        """
+        Looks up the key of the most recent backup in S3, returning `None` if
+        no backups are found.
+        """
+        # Backup keys sort by timestamp, so rather than listing the entire
+        # history, probe for keys newer than a cutoff that doubles in age each
+        # time nothing is found. Steady state, this is a single request.
+        now = datetime.utcnow()
+        days = 1
+        while days <= S3_PROBE_MAX_DAYS:
+            cutoff = self.s3_backup_key(now - timedelta(days=days))
+            backup_key = self.find_most_recent_backup_key(start_after=cutoff)
+            if backup_key:
+                return backup_key
+            days *= 2
+
+        # Nothing recent, fall back to searching everything
+        return self.find_most_recent_backup_key()
+
+    def find_most_recent_backup_key(self, start_after=None):
+        """
+        Lists backups in S3, optionally only those with keys sorting after
+        `start_after`, and returns the key of the most recent one or `None`
+        if no backups are found.
         """
-        # We have to sort the results ourselves
-        obj_list = self.client.list_objects(Bucket=self.s3_bucket,
-                                            Prefix=self.s3_backup_prefix)
-        backups = [o['Key'] for o in obj_list.get('Contents', [])]
-        backups.sort(reverse=True)
+        kwargs = {}
+        if start_after:
+            kwargs['StartAfter'] = start_after
+
+        # S3 lists keys in ascending lexicographic order and the timestamp
+        # format sorts the same way, so the last matching key on the final
+        # page is the most recent backup.
+        paginator = self.client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(Bucket=self.s3_bucket,
+                                   Prefix=self.s3_backup_prefix + '-',
+                                   PaginationConfig={'PageSize': 1000},
+                                   **kwargs)
+
+        # Every backup key shares the prefix and has a fixed-width stamp, so
+        # checking the length and suffix is enough to match our format
+        key_len = len(self.s3_backup_key(datetime(2000, 1, 1)))
 
-        # To ensure that the filename matches our format, iterate through our
-        # sorted list until we find a filename match.
         backup_key = None
-        for b in backups:
-            if S3_BACKUP_RE.match(os.path.basename(b)):
-                backup_key = b
-                break
+        for page in pages:
+            # To ensure that the filename matches our format, walk backwards
+            # through the page until we find a filename match.
+            for o in reversed(page.get('Contents', [])):
+                if len(o['Key']) == key_len and o['Key'].endswith('.zip'):
+                    backup_key = o['Key']
+                    break
 
         return backup_key
 
@@ -244,11 +488,8 @@ def main():
     args = parser.parse_args()
 
     # Parse out settings from the config file
-    try:
-        with open(args.cfg[0], 'r') as f:
-            config = ConfigParser()
-            config.readfp(f)
-    except IOError:
+    config = ConfigParser()
+    if not config.read(args.cfg[0]):
         logger.error('Unable to open config file \'{}\''.format(args.cfg[0]))
         sys.exit(1)
 
@@ -258,12 +499,9 @@ def main():
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-    # Parse out interesting pairs into their proper types from the config file
-    cfg = dict()
-    cfg['s3_bucket'] = config.get('main', 's3_bucket')
-    cfg['server_name'] = config.get('main', 'server_name')
-    cfg['server_root_dir'] = config.get('main', 'server_root_dir')
-    cfg['world_name'] = config.get('main', 'world_name')
+    # Pull out the interesting pairs from the config file in a single pass
+    main_cfg = dict(config.items('main'))
+    cfg = {k: main_cfg[k] for k in CONFIG_KEYS}
 
     p = Prospector(**cfg)
 
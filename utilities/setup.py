@@ -1,15 +1,21 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 """
 Populates config templates based on user input.
 """
 
+import os
 import sys
 from argparse import ArgumentParser
 from collections import defaultdict
+from configparser import ConfigParser
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 
+# Compiled templates are cached here between runs, and recompiled whenever the
+# templates change
+TEMPLATE_CACHE_DIR = '.jinja_cache'
+
 TYPE_NAMES = {
     float: 'number',
     int: 'integer',
@@ -22,7 +28,7 @@ def prompt_boolean(description):
     Prompts the user with the given `description` and returns a boolean
     indicating whether the answer was yes (True) or no (False).
     """
-    answer = raw_input(description + ' [yN] ') 
+    answer = input(description + ' [yN] ') 
     return answer and answer.lower() in ('yes', 'y')
 
 
@@ -40,25 +46,47 @@ def prompt_type(description, value_type, default=None):
     prompt = ''.join(prompt)
 
     while True:
-        value = raw_input(prompt) or default
+        value = input(prompt) or default
         if value is None:
             continue
 
-        if not isinstance(value, value_type):
-            try:
-                # Attempt to cast
-                value = value_type(value)
-            except ValueError:
-                print("{} is not a {}".format(value, TYPE_NAMES[value_type]))
-                continue
+        try:
+            value = cast_type(value, value_type)
+        except ValueError:
+            continue
         break
 
     return value
 
 
+def cast_type(value, value_type):
+    """
+    Returns `value` cast to `value_type`. If it can't be cast, the user is
+    told so and `ValueError` is raised.
+    """
+    if not isinstance(value, value_type):
+        try:
+            # Attempt to cast
+            value = value_type(value)
+        except ValueError:
+            print("{} is not a {}".format(value, TYPE_NAMES[value_type]))
+            raise
+    return value
+
+
 def main():
     parser = ArgumentParser(
         description="Populates configs based on user input.")
+    parser.add_argument('--config',
+        help="INI file with [aws] and [server] sections of preset settings. "
+             "Only settings missing from it are prompted for.")
+
+    args = parser.parse_args()
+
+    preset = ConfigParser(interpolation=None)
+    if args.config and not preset.read(args.config):
+        print("Unable to open config file '{}'".format(args.config))
+        sys.exit(1)
 
     # Tuples consisting of:
     # 1. Dictionary name
@@ -85,7 +113,19 @@ def main():
     
     variables = defaultdict(dict)
     for key, subkey, value_type, default, description in settings:
-        value = prompt_type(description, value_type, default)
+        value = None
+        if preset.has_option(key, subkey):
+            # As when prompting, an empty value means the default, so required
+            # settings left blank are still asked for
+            raw = preset.get(key, subkey) or default
+            if raw is not None:
+                try:
+                    value = cast_type(raw, value_type)
+                except ValueError:
+                    pass  # Fall back to asking
+
+        if value is None:
+            value = prompt_type(description, value_type, default)
         variables[key][subkey] = value
     
     # Force the user to review their settings
@@ -102,15 +142,21 @@ def main():
         sys.exit(1)
 
     # Populate the templates
-    env = Environment(loader=FileSystemLoader('.'), autoescape=True)
+    if not os.path.isdir(TEMPLATE_CACHE_DIR):
+        os.mkdir(TEMPLATE_CACHE_DIR)
+    # Templates are only loaded once per run, so skip the reload checks
+    env = Environment(loader=FileSystemLoader('.'), autoescape=True,
+                      auto_reload=False, cache_size=-1,
+                      bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR))
 
     templates = ['terraform/variables.tf.j2', 'ansible/group_vars/all.j2']
-    for template_path in templates:
-        template = env.get_template(template_path)
+    templates = [(p, env.get_template(p)) for p in templates]
 
+    context = dict(variables)
+    for template_path, template in templates:
         populated_path = template_path[:-3]
         with open(populated_path, 'w') as f:
-            f.write(template.render(**variables))
+            f.write(template.render(**context))
 
         print('{} written'.format(populated_path))
 
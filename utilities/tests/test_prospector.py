@@ -3,11 +3,12 @@ import os
 import shutil
 import sys
 import tempfile
-from ConfigParser import RawConfigParser
+from concurrent.futures import ThreadPoolExecutor
+from configparser import RawConfigParser
 from datetime import datetime, timedelta
 from unittest import TestCase
 from shutil import rmtree
-from zipfile import ZipFile
+from zipfile import ZipFile, BadZipFile, ZIP_DEFLATED, ZIP_STORED
 
 import boto3
 import sure
@@ -19,20 +20,78 @@ from utilities.prospector import main as prospector_main, Prospector
 
 S3_DATE_FMT = '%Y%m%dT%H%M%S'
 
+# keep mock servers in memory where possible, this must be a single
+# filesystem since test directories are hard linked from a template
+TEMP_ROOT = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def walk_files(path):
+    """
+    Yields the path of every file beneath `path`.
+    """
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(entry.path)
+            else:
+                yield entry.path
+
+
+def file_checksum(file_path):
+    """
+    Returns a BLAKE2 checksum of the file at `file_path`.
+    """
+    # hash in chunks, rather than reading whole files into memory
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tree_digest(path):
+    """
+    Returns a single BLAKE2 digest covering the relative path and contents of
+    every file beneath `path`, so two trees can be compared in one go.
+    """
+    h = hashlib.blake2b()
+    for file_path in sorted(walk_files(path)):
+        h.update(os.path.relpath(file_path, path).encode())
+        h.update(b'\0')
+        h.update(str(os.path.getsize(file_path)).encode())
+        h.update(b'\0')
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
 
 class TestProspector(TestCase):
 
-    def setUp(self):
-        # mock S3 is used for all tests
-        self.mock = mock_s3()
-        self.mock.start()
+    @classmethod
+    def setUpClass(cls):
+        # mock S3 is used for all tests, with a single connection to it
+        cls.mock = mock_s3()
+        cls.mock.start()
+        cls.s3_client = boto3.client('s3', region_name='us-east-1')
+
+        # tests only ever compare the mock server's contents, so build it
+        # once and hard link it into each test's temporary directory
+        cls.template_dir = tempfile.mkdtemp(dir=TEMP_ROOT)
+        cls.populate_mock_server(os.path.join(cls.template_dir, 'my_server'),
+                                 'my_world')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.template_dir)
+        cls.mock.stop()
 
-        # create a connection to our mock S3 and populate it
-        self.s3_client = boto3.client('s3', region_name='us-east-1')
+    def setUp(self):
+        # each test starts with an empty bucket
         self.s3_client.create_bucket(Bucket='my_bucket')
 
         # make a temporary directory to work in, so it can be cleaned up later
-        self.temp_dir = tempfile.mkdtemp()
+        self.temp_dir = tempfile.mkdtemp(dir=TEMP_ROOT)
 
         self.cfg = {
             'server_name': 'my_server',
@@ -44,49 +103,73 @@ class TestProspector(TestCase):
         # create mock server and world directories
         self.server_path = os.path.join(self.temp_dir, self.cfg['server_name'])
         self.world_path = os.path.join(self.server_path, self.cfg['world_name'])
-        os.makedirs(self.world_path)
-
-        self.populate_mock_server()
+        shutil.copytree(os.path.join(self.template_dir, self.cfg['server_name']),
+                        self.server_path, copy_function=os.link)
 
     def tearDown(self):
         shutil.rmtree(self.temp_dir)
-        self.mock.stop()
 
-    def populate_mock_server(self):
+        # empty out and remove the bucket, ready for the next test
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket='my_bucket'):
+            objects = [{'Key': o['Key']} for o in page.get('Contents', [])]
+            if objects:
+                self.s3_client.delete_objects(Bucket='my_bucket',
+                                              Delete={'Objects': objects})
+        self.s3_client.delete_bucket(Bucket='my_bucket')
+
+    @staticmethod
+    def populate_mock_server(server_path, world_name):
         """
-        Populates a mock server directory with files, including a nested
-        structure in the world subdirectory.
+        Creates a mock server directory at `server_path` populated with files,
+        including a nested structure in the `world_name` subdirectory.
         """
-        # write a number of files to the server directory
-        for i in range(0, 4):
-            with open(os.path.join(self.server_path, str(i)), 'w') as f:
-                f.write(os.urandom(33))
+        world_path = os.path.join(server_path, world_name)
+        os.makedirs(world_path)
 
-        # and to the world directory, nested in subfolders
+        # a number of files in the server directory, and in the world
+        # directory, nested in subfolders
+        files = [(os.path.join(server_path, str(i)), 33) for i in range(0, 4)]
         for f in range(0, 3):
-            folder_path = os.path.join(self.world_path, 'folder-' + str(f))
+            folder_path = os.path.join(world_path, 'folder-' + str(f))
             os.mkdir(folder_path)
-
-            for i in range(0, 7):
-                with open(os.path.join(folder_path, str(i)), 'w') as f:
-                    f.write(os.urandom(100))
+            files.extend((os.path.join(folder_path, str(i)), 100)
+                         for i in range(0, 7))
+
+        # draw all the random data at once, and slice it up between the files
+        data = memoryview(os.urandom(sum(size for _, size in files)))
+        offset = 0
+        for file_path, size in files:
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                os.write(fd, data[offset:offset + size])
+            finally:
+                os.close(fd)
+            offset += size
+
+    def write_mock_archive(self):
+        """
+        Writes a dummy backup archive with random contents, so no two are
+        alike, and returns its path.
+        """
+        mock_archive = os.path.join(self.temp_dir, 'backup.zip')
+        with open(mock_archive, 'wb') as f:
+            f.write(os.urandom(100))
+        return mock_archive
 
     def checksum_walk(self, path):
         """
-        Given a `path`, returns a dictionary of `relative_path` => MD5
-        `checksum` pairs. `relative_path` is created by stripping `path` off
-        all absolute paths.
+        Given a `path`, returns a dictionary of `relative_path` => BLAKE2
+        `checksum` pairs, where `relative_path` is relative to `path`.
         """
-        # traverse the original world directory, gathering paths and checksums
-        checksums = {}
-        for folder, _, files in os.walk(path):
-            relative_folder = folder.replace(path, '')
-            for file_name in files:
-                file_path = os.path.join(folder, file_name)
-                relative_path = os.path.join(relative_folder, file_name)
-                with open(file_path, 'r') as f:
-                    checksums[relative_path] = hashlib.md5(f.read()).hexdigest()
-        return checksums
+        # traverse the original world directory, gathering paths, then hash
+        # the files in parallel
+        paths = [(os.path.relpath(file_path, path), file_path)
+                 for file_path in walk_files(path)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            digests = executor.map(file_checksum, [p for _, p in paths])
+            return {r: d for (r, _), d in zip(paths, digests)}
 
     def test_properties(self):
         # given a Prospector created with the base config
@@ -110,7 +193,7 @@ class TestProspector(TestCase):
 
         # and write it out to file
         config_path = os.path.join(self.temp_dir, 'prospector.cfg')
-        with open(config_path, 'wb') as f:
+        with open(config_path, 'w') as f:
             config.write(f)
 
         # and invoking the backup action shouldn't crash
@@ -138,7 +221,7 @@ class TestProspector(TestCase):
 
         # and write it out to file
         config_path = os.path.join(self.temp_dir, 'prospector.cfg')
-        with open(config_path, 'wb') as f:
+        with open(config_path, 'w') as f:
             config.write(f)
 
         # and if a backup is pushed to S3
@@ -174,6 +257,20 @@ class TestProspector(TestCase):
         # Lastly, restore the original arguments
         sys.argv = old_sys_argv
 
+    def test_script_invocation_missing_config(self):
+        old_sys_argv = sys.argv
+
+        # when the script is pointed at a config file that doesn't exist, it
+        # should exit immediately
+        with self.assertRaises(SystemExit):
+            config_path = os.path.join(self.temp_dir, 'missing.cfg')
+            log_path = os.path.join(self.temp_dir, 'prospector.log')
+            sys.argv = './utilities/prospector.py backup --cfg {} --log {}'.format(config_path, log_path).split(' ')
+            prospector_main()
+
+        # Lastly, restore the original arguments
+        sys.argv = old_sys_argv
+
     def test_backup_creation(self):
         # given a Prospector created with the base config
         p = Prospector(**self.cfg)
@@ -195,21 +292,118 @@ class TestProspector(TestCase):
 
                 # all filenames should start with the world name, indicating
                 # only world-related files were packed
-                for zinfo in members_info:
-                    zinfo.filename.startswith(self.cfg['world_name']).should.be.true
+                prefix = self.cfg['world_name']
+                all(z.filename.startswith(prefix) for z in members_info).should.be.true
 
                 z.extractall(extraction_dir)
 
-            # compare the paths and checksums of the original world directory
+            # compare the paths and contents of the original world directory
             # with the one just extracted
             extracted_world_path = os.path.join(extraction_dir, self.cfg['world_name'])
-            extracted_checksums = self.checksum_walk(extracted_world_path)
-            original_checksums = self.checksum_walk(p.world_path)
+            tree_digest(extracted_world_path).should.equal(tree_digest(p.world_path))
+        finally:
+            rmtree(os.path.dirname(backup_path))
 
-            extracted_checksums.should.equal(original_checksums)
+    def test_backup_creation_compression(self):
+        # given a Prospector created with the base config
+        p = Prospector(**self.cfg)
+
+        # and a world with a region file
+        region_path = os.path.join(self.world_path, 'region')
+        os.mkdir(region_path)
+        with open(os.path.join(region_path, 'r.0.0.mca'), 'wb') as f:
+            f.write(os.urandom(100))
+
+        backup_path = p.create_current_backup()
+
+        try:
+            with ZipFile(backup_path, 'r') as z:
+                # region files are already compressed, so they should be
+                # stored as-is, while everything else should be deflated
+                for zinfo in z.infolist():
+                    if zinfo.filename.endswith('.mca'):
+                        self.assertEqual(zinfo.compress_type, ZIP_STORED)
+                    else:
+                        self.assertEqual(zinfo.compress_type, ZIP_DEFLATED)
+        finally:
+            rmtree(os.path.dirname(backup_path))
+
+    def test_backup_creation_symlinks(self):
+        # given a Prospector created with the base config
+        p = Prospector(**self.cfg)
+
+        # and a world containing symlinks to a file, a directory and nothing
+        folder_path = os.path.join(self.world_path, 'folder-0')
+        os.symlink(os.path.join(folder_path, '0'),
+                   os.path.join(self.world_path, 'file-link'))
+        os.symlink(folder_path, os.path.join(self.world_path, 'folder-link'))
+        os.symlink(os.path.join(self.world_path, 'missing'),
+                   os.path.join(self.world_path, 'broken-link'))
+
+        backup_path = p.create_current_backup()
+
+        try:
+            with ZipFile(backup_path, 'r') as z:
+                names = z.namelist()
+
+            # the linked file should be archived, but the linked directory and
+            # the broken link should be left out entirely
+            names.should.contain('my_world/file-link')
+            names.shouldnt.contain('my_world/broken-link')
+            [n for n in names if n.startswith('my_world/folder-link')].should.be.empty
+            len(names).should.equal(22)
         finally:
             rmtree(os.path.dirname(backup_path))
 
+    def test_backup_creation_missing_world(self):
+        # given a Prospector created with the base config
+        p = Prospector(**self.cfg)
+
+        # when the world directory doesn't exist
+        shutil.rmtree(self.world_path)
+
+        # no backup should be created
+        p.create_current_backup().should.be.none
+
+    def test_extract_backup(self):
+        # given an archive containing a world, along with some junk
+        archive_path = os.path.join(self.temp_dir, 'backup.zip')
+        with ZipFile(archive_path, 'w') as z:
+            z.writestr('my_world/', '')
+            z.writestr('my_world/level.dat', 'level')
+            z.writestr('my_world/region/r.0.0.mca', 'region')
+            z.writestr('__MACOSX/my_world/._level.dat', 'junk')
+            z.writestr('../escaped', 'escaped')
+
+        # when it's extracted
+        extraction_dir = os.path.join(self.temp_dir, 'extraction')
+        with ZipFile(archive_path, 'r') as z:
+            Prospector.extract_backup(z, extraction_dir)
+
+        # only the world files should be present
+        sorted(self.checksum_walk(extraction_dir)).should.equal(
+            ['my_world/level.dat', 'my_world/region/r.0.0.mca'])
+        os.path.exists(os.path.join(self.temp_dir, 'escaped')).should.be.false
+
+    def test_extract_backup_corrupt(self):
+        # given an archive with a member whose data has been corrupted
+        archive_path = os.path.join(self.temp_dir, 'backup.zip')
+        with ZipFile(archive_path, 'w', ZIP_STORED) as z:
+            z.writestr('my_world/level.dat', b'level data')
+        with open(archive_path, 'rb') as f:
+            data = bytearray(f.read())
+        data[data.index(b'level data')] ^= 0xff
+        with open(archive_path, 'wb') as f:
+            f.write(data)
+
+        # when it's extracted, the bad member should be reported
+        extraction_dir = os.path.join(self.temp_dir, 'extraction')
+        with ZipFile(archive_path, 'r') as z:
+            Prospector.extract_backup.when.called_with(z, extraction_dir).should.throw(BadZipFile)
+
+        # and no partial files should be left behind
+        [f for f in walk_files(extraction_dir) if f.endswith('.part')].should.be.empty
+
     def test_s3_backup_key(self):
         # Given a Prospector created with the base config
         p = Prospector(**self.cfg)
@@ -227,6 +421,18 @@ class TestProspector(TestCase):
         # it should equal the original datetime
         key_dt.should.equal(dt)
 
+    def test_backup_time_from_key(self):
+        # backup times should be parsed from keys and filenames alike, even
+        # when the world name contains dashes
+        for key in ('my_server/backups/my-world-20200304T123540.zip',
+                    'my-world-20200304T123540.zip',
+                    'my-world-20200304T123540'):
+            self.assertEqual(Prospector.backup_time_from_key(key), datetime(2020, 3, 4, 12, 35, 40))
+
+        # and anything else should be rejected
+        with self.assertRaises(ValueError):
+            Prospector.backup_time_from_key('my_server/backups/my_world.zip')
+
     @freeze_time("2020-03-04 02:34:56")
     def test_push_current_backup(self):
         # given a Prospector created with the base config
@@ -248,26 +454,34 @@ class TestProspector(TestCase):
         backup_time = p.backup_time_from_key(backup_meta['Key'])
         backup_time.should.equal(datetime(2020, 3, 4, 2, 34, 56))
 
-    def test_upload_backup(self):
+    def test_push_current_backup_missing_world(self):
         # given a Prospector created with the base config
         p = Prospector(**self.cfg)
 
-        # create a dummy backup archive
-        mock_archive = os.path.join(self.temp_dir, 'backup.zip')
-        with open(mock_archive, 'w') as f:
-            f.write(os.urandom(100))
+        # when the world directory doesn't exist and we push a backup
+        shutil.rmtree(self.world_path)
+        p.push_current_backup()
+
+        # nothing should be uploaded to S3
+        response = self.s3_client.list_objects_v2(Bucket=self.cfg['s3_bucket'])
+        response['KeyCount'].should.equal(0)
+
+    def test_upload_backup(self):
+        # given a Prospector created with the base config
+        p = Prospector(**self.cfg)
 
         # upload some backups
         time = datetime(2020, 5, 23, 11, 45)
         backup_times = []
-        for i in range(0, 5):
-            backup_times.append(time)
+        with freeze_time(time) as frozen:
+            for i in range(0, 5):
+                backup_times.append(time)
 
-            with freeze_time(time):
-                p.upload_backup(mock_archive)
+                frozen.move_to(time)
+                p.upload_backup(self.write_mock_archive())
 
-            # shift the clock ahead for the next backup
-            time += timedelta(hours=13)
+                # shift the clock ahead for the next backup
+                time += timedelta(hours=13)
 
         # now, looking in S3, all backups should be present
         response = self.s3_client.list_objects_v2(Bucket=self.cfg['s3_bucket'])
@@ -276,50 +490,157 @@ class TestProspector(TestCase):
         # and the tags for each backup should be correct, with the newest
         # backup tagged as `new`, and the rest tagged as `old`, intended for
         # use by the lifecycle rules in place on the bucket.
-        for item in response['Contents']:
-            response = self.s3_client.get_object_tagging(
-                Bucket=self.cfg['s3_bucket'],
-                Key=item['Key']
-            )
+        old_backups = set(backup_times[:-1])
+        newest_backup = backup_times[-1]
+
+        keys = [item['Key'] for item in response['Contents']]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            tag_responses = list(executor.map(
+                lambda k: self.s3_client.get_object_tagging(Bucket=self.cfg['s3_bucket'], Key=k),
+                keys
+            ))
 
+        for key, response in zip(keys, tag_responses):
             # convert the tags into an easier-to-use dictionary format
             tags = {t['Key']: t['Value'] for t in response['TagSet']}
 
             # check them against the backup times
-            bt = p.backup_time_from_key(item['Key'])
-            if bt in backup_times[:-1]:
-                tags.should.equal({'backup': 'old'})
-            elif bt == backup_times[-1]:
-                tags.should.equal({'backup': 'new'})
+            bt = p.backup_time_from_key(key)
+            if bt == newest_backup:
+                self.assertEqual(tags, {'backup': 'new'})
+            elif bt in old_backups:
+                self.assertEqual(tags, {'backup': 'old'})
             else:
-                raise Exception('Unexpected backup key \'{}\''.format(item['Key']))
+                raise Exception('Unexpected backup key \'{}\''.format(key))
 
-    def test_get_most_recent_backup_key(self):
+    @freeze_time("2020-05-23 11:45:00")
+    def test_upload_backup_same_stamp(self):
         # given a Prospector created with the base config
         p = Prospector(**self.cfg)
 
-        # create a dummy backup archive
-        mock_archive = os.path.join(self.temp_dir, 'backup.zip')
-        with open(mock_archive, 'w') as f:
-            f.write(os.urandom(100))
+        # when it's uploaded twice with the same timestamp
+        p.upload_backup(self.write_mock_archive())
+        p.upload_backup(self.write_mock_archive())
+
+        # the backup should still be tagged as the current one
+        response = self.s3_client.get_object_tagging(
+            Bucket=self.cfg['s3_bucket'],
+            Key='my_server/backups/my_world-20200523T114500.zip'
+        )
+        response['TagSet'].should.equal([{'Key': 'backup', 'Value': 'new'}])
+
+    def test_upload_backup_stamp(self):
+        # given a Prospector created with the base config
+        p = Prospector(**self.cfg)
+
+        # when a backup is uploaded with an explicit stamp
+        p.upload_backup(self.write_mock_archive(), stamp=datetime(2020, 3, 4, 12, 35, 40))
+
+        # it should be keyed by that stamp, rather than the current time
+        p.get_most_recent_backup_key().should.equal('my_server/backups/my_world-20200304T123540.zip')
+
+    def test_upload_backup_unchanged(self):
+        # given a Prospector created with the base config
+        p = Prospector(**self.cfg)
+
+        # when the same archive is uploaded twice
+        mock_archive = self.write_mock_archive()
+        with freeze_time(datetime(2020, 5, 23, 11, 45)) as frozen:
+            p.upload_backup(mock_archive)
+            frozen.move_to(datetime(2020, 5, 24, 11, 45))
+            p.upload_backup(mock_archive)
+
+            # only the first should be stored, and still be current
+            response = self.s3_client.list_objects_v2(Bucket=self.cfg['s3_bucket'])
+            response['KeyCount'].should.equal(1)
+            p.get_most_recent_backup_key().should.equal('my_server/backups/my_world-20200523T114500.zip')
+
+            # but once the archive changes, it should be uploaded again
+            frozen.move_to(datetime(2020, 5, 25, 11, 45))
+            p.upload_backup(self.write_mock_archive())
+        response = self.s3_client.list_objects_v2(Bucket=self.cfg['s3_bucket'])
+        response['KeyCount'].should.equal(2)
+
+    def test_get_most_recent_backup_key(self):
+        # given a Prospector created with the base config
+        p = Prospector(**self.cfg)
 
         # upload a few backups
         time = datetime(2020, 5, 23, 11, 45)
         backup_times = []
-        for i in range(0, 5):
-            backup_times.append(time)
+        with freeze_time(time) as frozen:
+            for i in range(0, 5):
+                backup_times.append(time)
 
-            with freeze_time(time):
-                p.upload_backup(mock_archive)
+                frozen.move_to(time)
+                p.upload_backup(self.write_mock_archive())
 
-            # shift the clock ahead for the next backup
-            time += timedelta(hours=13)
+                # shift the clock ahead for the next backup
+                time += timedelta(hours=13)
 
         # if the most recent one is requested, the date should be that of
         # the last backup made
         backup_key = p.get_most_recent_backup_key()
         backup_key.should.equal('my_server/backups/my_world-20200525T154500.zip')
 
+    def test_get_most_recent_backup_key_cached(self):
+        # given a Prospector created with the base config, which has looked up
+        # the most recent backup
+        self.s3_client.put_object(Bucket=self.cfg['s3_bucket'],
+                                  Key='my_server/backups/my_world-20200523T114500.zip',
+                                  Body='')
+        p = Prospector(**self.cfg)
+        p.get_most_recent_backup_key().should.equal('my_server/backups/my_world-20200523T114500.zip')
+
+        # when a newer backup appears in S3 from elsewhere
+        self.s3_client.put_object(Bucket=self.cfg['s3_bucket'],
+                                  Key='my_server/backups/my_world-20200524T114500.zip',
+                                  Body='')
+
+        # the same Prospector should keep returning the cached key, while a
+        # new one should see the newer backup
+        p.get_most_recent_backup_key().should.equal('my_server/backups/my_world-20200523T114500.zip')
+        Prospector(**self.cfg).get_most_recent_backup_key().should.equal('my_server/backups/my_world-20200524T114500.zip')
+
+    def test_get_most_recent_backup_key_probe(self):
+        # given a Prospector created with the base config
+        p = Prospector(**self.cfg)
+
+        # upload an old backup, followed by a few recent ones
+        times = [
+            datetime(2020, 1, 2, 3, 4),
+            datetime(2020, 5, 21, 8, 0),
+            datetime(2020, 5, 23, 11, 45),
+            datetime(2020, 5, 23, 18, 30)
+        ]
+        with freeze_time(times[0]) as frozen:
+            for time in times:
+                frozen.move_to(time)
+                p.upload_backup(self.write_mock_archive())
+
+            # whether looking shortly after the last backup, a while after, or
+            # long after, the most recent backup should be found
+            for now in ('2020-05-23 19:00:00', '2020-06-10 00:00:00', '2021-01-01 00:00:00'):
+                frozen.move_to(now)
+                backup_key = Prospector(**self.cfg).get_most_recent_backup_key()
+                self.assertEqual(backup_key, 'my_server/backups/my_world-20200523T183000.zip')
+
+    def test_get_most_recent_backup_key_ignores_other_keys(self):
+        # given a Prospector created with the base config
+        p = Prospector(**self.cfg)
+
+        # and a bucket with a backup, alongside keys from another world with
+        # a similar name and keys that aren't backups at all
+        for key in ('my_server/backups/my_world-20200523T114500.zip',
+                    'my_server/backups/my_world_nether-20300101T000000.zip',
+                    'my_server/backups/my_world-notes.txt',
+                    'my_server/backups/my_world/level.dat'):
+            self.s3_client.put_object(Bucket=self.cfg['s3_bucket'], Key=key, Body='')
+
+        # only the backup should be found
+        backup_key = p.get_most_recent_backup_key()
+        backup_key.should.equal('my_server/backups/my_world-20200523T114500.zip')
+
     def test_fetch_most_recent_backup(self):
         # given a Prospector created with the base config
         p = Prospector(**self.cfg)
@@ -327,19 +648,18 @@ class TestProspector(TestCase):
         # create and upload some backups, with different world contents
         time = datetime(2020, 5, 23, 11, 45)
         backup_times = []
-        for i in range(0, 5):
-            backup_times.append(time)
-
-            # destroy and recreate so the contents vary
-            shutil.rmtree(self.server_path)
-            os.makedirs(self.world_path)
+        with freeze_time(time) as frozen:
+            for i in range(0, 5):
+                backup_times.append(time)
 
-            self.populate_mock_server()
+                # destroy and recreate so the contents vary
+                shutil.rmtree(self.server_path)
+                self.populate_mock_server(self.server_path, self.cfg['world_name'])
 
-            with freeze_time(time):
+                frozen.move_to(time)
                 p.push_current_backup()
 
-            time += timedelta(days=27)
+                time += timedelta(days=27)
 
         # get the checksum of the current world, then blow it awayd
         current_world_checksum = self.checksum_walk(self.world_path)